@@ -1,5 +1,8 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
 import duckdb
 import plotly.express as px
 from pathlib import Path
@@ -21,72 +24,85 @@ st.set_page_config(
 # --------------------
 # LOAD DATA (ETFs TIME SERIES)
 # --------------------
+def _cache_key() -> tuple:
+    # Clé d'invalidation basée sur les mtimes : le cache Streamlit se
+    # rafraîchit automatiquement quand l'ETL réécrit les fichiers parquet,
+    # pour le coût d'un stat() par fichier.
+    return tuple(sorted((p.name, p.stat().st_mtime_ns) for p in DATA_DIR.glob("*.parquet")))
+
+
 @st.cache_data
-def load_data():
-    data_files = list(DATA_DIR.glob("*_data.parquet"))
+def load_data(key: tuple):
+    data_files = sorted(DATA_DIR.glob("*_data.parquet"))
     if not data_files:
         st.error(f"Aucun fichier trouvé dans {DATA_DIR}")
         st.stop()
 
-    dfs = []
-
-    for file in data_files:
-        # 1️⃣ Tentative lecture parquet
+    # Un seul scan Arrow pour tous les fichiers : le décodage des colonnes se
+    # fait en C++ et on évite un pd.read_parquet + concat pandas par fichier.
+    dataset = ds.dataset([str(p) for p in data_files], format="parquet")
+    tables = []
+    for file, fragment in zip(data_files, dataset.get_fragments()):
         try:
-            df = pd.read_parquet(file)
-        except Exception:
-            # 2️⃣ Fallback JSON lines (TON CAS)
-            try:
-                df = pd.read_json(file, lines=True)
-            except Exception as e:
-                st.warning(f"Impossible de lire {file.name} ({e})")
-                continue
-
-        # Nettoyage colonnes
-        df.columns = [c.strip().lower() for c in df.columns]
-
-        # Vérifications
-        if "date" not in df.columns:
-            st.warning(f"Colonne 'date' manquante dans {file.name}")
-            continue
-
-        if "close" not in df.columns:
-            st.warning(f"Colonne 'close' manquante dans {file.name}")
+            tbl = fragment.to_table()
+        except Exception as e:
+            st.warning(f"Impossible de lire {file.name} ({e})")
             continue
+        # Métadonnées pandas retirées pour que 'Date' (colonne d'index côté
+        # ETL) reste une colonne ordinaire après concaténation.
+        tbl = tbl.replace_schema_metadata(None)
+        etf_name = file.stem.replace("_data", "")
+        tbl = tbl.append_column("etf", pa.array([etf_name] * tbl.num_rows, pa.string()))
+        tables.append(tbl)
+
+    if not tables:
+        st.error("Aucun fichier data correct trouvé")
+        st.stop()
 
-        # Conversion timestamp (ms → datetime)
-        if np.issubdtype(df["date"].dtype, np.number):
-            df["date"] = pd.to_datetime(df["date"], unit="ms", errors="coerce")
-        else:
-            df["date"] = pd.to_datetime(df["date"], errors="coerce")
-
-        df = df.dropna(subset=["date"])
-
-        # Nom ETF
-        df["etf"] = file.stem.replace("_data", "")
+    # "permissive" promeut les types divergents (ex. anciens fichiers en
+    # float64 à côté des nouveaux en float32) au lieu de lever une erreur.
+    df_all = pa.concat_tables(tables, promote_options="permissive").to_pandas()
 
-        dfs.append(df)
+    # Nettoyage colonnes
+    df_all.columns = [c.strip().lower() for c in df_all.columns]
 
-    if not dfs:
-        st.error("Aucun fichier data correct trouvé")
+    # Vérifications
+    if "date" not in df_all.columns or "close" not in df_all.columns:
+        st.error("Colonne 'date' ou 'close' manquante dans les fichiers data")
         st.stop()
 
-    df_all = pd.concat(dfs, ignore_index=True)
+    # Conversion timestamp (ms → datetime)
+    if np.issubdtype(df_all["date"].dtype, np.number):
+        df_all["date"] = pd.to_datetime(df_all["date"], unit="ms", errors="coerce")
+    else:
+        df_all["date"] = pd.to_datetime(df_all["date"], errors="coerce")
+
+    df_all = df_all.dropna(subset=["date"])
 
-    # Calcul rendements
+    # Les rendements sont calculés côté DuckDB (vue "r" ci-dessous).
     df_all = df_all.sort_values(["etf", "date"])
-    df_all["return"] = df_all.groupby("etf")["close"].pct_change().fillna(0)
+
+    # float32 suffit largement pour des prix : moitié moins d'octets à
+    # déplacer dans DuckDB, les pivots et la sérialisation Plotly.
+    num_cols = df_all.select_dtypes("float64").columns
+    df_all[num_cols] = df_all[num_cols].astype("float32")
 
     return df_all
 
 
-df = load_data()
+df = load_data(_cache_key())
 
 # --------------------
 # LOAD ETF INFOS
 # --------------------
 @st.cache_data
-def load_info():
+def load_info(key: tuple):
+    # Fichier consolidé écrit par l'ETL (une ligne par ETF).
+    info_path = DATA_DIR / "infos.parquet"
+    if info_path.exists():
+        return pd.read_parquet(info_path).rename(columns={"name": "etf"})
+
+    # Fallback : anciens fichiers par ETF (avant consolidation).
     info_files = list(DATA_DIR.glob("*_infos.parquet"))
     if not info_files:
         st.warning("Aucun fichier infos trouvé")
@@ -95,21 +111,42 @@ def load_info():
     dfs = []
     for file in info_files:
         df_info = pd.read_parquet(file)
-        if "symbol" in df_info.columns:
-            df_info.rename(columns={"symbol": "etf"}, inplace=True)
+        df_info["etf"] = file.stem.replace("_infos", "")
         dfs.append(df_info)
 
-    if not dfs:
-        return pd.DataFrame()
     return pd.concat(dfs, ignore_index=True)
 
-df_info = load_info()
+df_info = load_info(_cache_key())
 
 # --------------------
 # SQL ANALYSIS (DuckDB)
 # --------------------
-con = duckdb.connect()
-con.register("etf", df)
+@st.cache_resource(max_entries=1)
+def get_duck(_arrow_tbl: pa.Table, key: tuple):
+    """Connexion DuckDB persistante entre les reruns Streamlit.
+
+    La table Arrow est lue zéro-copie par DuckDB ; la vue "r" dérive les
+    rendements en un seul passage SQL vectorisé (LAG + window) au lieu d'un
+    groupby pandas suivi d'un second scan. max_entries=1 : la clé change à
+    chaque run de l'ETL, on évince l'ancienne connexion au lieu d'accumuler
+    une copie du dataset par run.
+    """
+    con = duckdb.connect()
+    con.register("etf", _arrow_tbl)
+    con.execute("""
+    CREATE OR REPLACE VIEW r AS
+    SELECT
+        etf,
+        date,
+        close,
+        COALESCE(close / LAG(close) OVER (PARTITION BY etf ORDER BY date) - 1, 0) AS return
+    FROM etf
+    """)
+    return con
+
+
+arrow_tbl = pa.Table.from_pandas(df, preserve_index=False)
+con = get_duck(arrow_tbl, _cache_key())
 
 stats = con.execute("""
 SELECT
@@ -117,11 +154,13 @@ SELECT
     AVG(return) AS mean_return,
     STDDEV(return) AS volatility,
     SUM(return) AS cumulative_return
-FROM etf
+FROM r
 GROUP BY etf
 ORDER BY cumulative_return DESC
 """).df()
 
+df_returns = con.execute("SELECT etf, date, return FROM r").df()
+
 # --------------------
 # SIDEBAR
 # --------------------
@@ -168,8 +207,11 @@ if page == "Présentation":
 elif page == "Vue globale du marché":
     st.title("🌍 Vue globale des ETF")
 
-    df_cum = df_filtered.copy()
-    df_cum["cumulative_return"] = df_cum.groupby("etf")["return"].cumsum()
+    df_cum = con.execute("""
+    SELECT etf, date, SUM(return) OVER (PARTITION BY etf ORDER BY date) AS cumulative_return
+    FROM r
+    """).df()
+    df_cum = df_cum[df_cum["etf"].isin(selected_etf)]
 
     fig = px.line(
         df_cum,
@@ -199,10 +241,12 @@ elif page == "Risque & Rendement":
     )
     st.plotly_chart(fig, use_container_width=True)
 
-    corr = df_filtered.pivot_table(
-        values="return",
+    # (date, etf) est déjà unique : pivot est un pur reshape, sans
+    # l'agrégation implicite (mean) que déclenche pivot_table.
+    corr = df_returns[df_returns["etf"].isin(selected_etf)].pivot(
         index="date",
-        columns="etf"
+        columns="etf",
+        values="return"
     ).corr()
 
     fig_corr = px.imshow(
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from pathlib import Path
+import os
 import subprocess
 import sys
 from scripts.pipeline_etl_finance import run_etl_for_universe
@@ -57,7 +58,13 @@ def run_pipeline_auto(period: str = PERIOD_DEFAULT, config_path: str | None = No
 def launch_streamlit() -> None:
     """Lancer Streamlit pour l'interface."""
     print("=== DÉMARRAGE DE L'APPLICATION STREAMLIT ===")
-    subprocess.run([sys.executable, "-m", "streamlit", "run", str(STREAMLIT_SCRIPT)])
+    cmd = [sys.executable, "-m", "streamlit", "run", str(STREAMLIT_SCRIPT)]
+    if os.name == "posix":
+        # Remplace le processus courant : l'interpréteur ETL (DataFrames,
+        # caches yfinance, sessions) n'occupe plus de RAM pendant toute la
+        # durée de vie de Streamlit.
+        os.execvp(cmd[0], cmd)
+    subprocess.run(cmd)
 
 def main(interactive: bool = True) -> None:
     """Point d'entrée principal."""
@@ -1,11 +1,33 @@
 import argparse
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import requests
 import yfinance as yf
 
+try:
+    # Cache disque optionnel : ne télécharge que le delta d'historique entre
+    # deux runs (cache dans ~/.cache/yfinance-cache, surchargeable via XDG_CACHE_HOME).
+    import yfinance_cache as yfc
+except ImportError:
+    yfc = None
+
+try:
+    import requests_cache
+except ImportError:
+    requests_cache = None
+
+# Désactivable via PRISME_YFC=0 (utile en CI ou pour forcer un refresh complet).
+USE_CACHE = os.environ.get("PRISME_YFC", "1") == "1"
+
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 RAW_DIR = PROJECT_ROOT / "data" / "raw"
@@ -13,7 +35,7 @@ INTERIM_DIR = PROJECT_ROOT / "data" / "interim"
 PROCESSED_DIR = PROJECT_ROOT / "data" / "processed"
 
 
-KEYS_TO_KEEP = [
+KEYS_TO_KEEP: tuple[str, ...] = (
     "symbol",
     "shortName",
     "longName",
@@ -31,14 +53,44 @@ KEYS_TO_KEEP = [
     "dividendYield",
     "fiftyTwoWeekLow",
     "fiftyTwoWeekHigh",
-]
+)
+
+
+# Schémas Arrow figés : pas d'inférence de dtypes à chaque écriture, et des
+# types garantis identiques d'un run à l'autre pour les lecteurs en aval.
+OHLCV_SCHEMA = pa.schema(
+    [
+        ("Open", pa.float32()),
+        ("High", pa.float32()),
+        ("Low", pa.float32()),
+        ("Close", pa.float32()),
+        ("Volume", pa.int64()),
+        ("Date", pa.timestamp("ns")),
+    ]
+)
+
+_INFO_STRING_KEYS = ("symbol", "shortName", "longName", "fundFamily", "legalType", "currency")
+INFO_SCHEMA = pa.schema(
+    [("name", pa.string())]
+    + [(k, pa.string() if k in _INFO_STRING_KEYS else pa.float64()) for k in KEYS_TO_KEEP]
+)
+
+
+def _filter_info(asset_info: dict) -> dict:
+    return {k: asset_info.get(k) for k in KEYS_TO_KEEP}
+
+
+def _write_json(path: Path, obj: dict) -> None:
+    # Encodeur natif ~10x plus rapide que json.dump ; OPT_SERIALIZE_NUMPY
+    # gère les scalaires numpy présents dans asset.info.
+    path.write_bytes(
+        orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    )
 
 
 def setup_directories() -> None:
-    (PROJECT_ROOT / "data").mkdir(exist_ok=True)
-    RAW_DIR.mkdir(parents=True, exist_ok=True)
-    INTERIM_DIR.mkdir(parents=True, exist_ok=True)
-    PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+    for directory in (RAW_DIR, INTERIM_DIR, PROCESSED_DIR):
+        directory.mkdir(parents=True, exist_ok=True)
 
 
 def load_universe(config_path: str | None = None) -> dict[str, str]:
@@ -59,135 +111,251 @@ def load_universe(config_path: str | None = None) -> dict[str, str]:
     }
 
 
-def extract_asset(ticker_symbol: str, period: str = "5y") -> tuple[pd.DataFrame, dict, pd.DataFrame]:
-    asset = yf.Ticker(ticker_symbol)
-    df_history = asset.history(period=period)
-    asset_info = asset.info
-    df_div = pd.DataFrame(asset.dividends)
-    return df_history, asset_info, df_div
+@lru_cache(maxsize=1)
+def _get_session() -> requests.Session | None:
+    # PRISME_HTTP_CACHE=1 active un cache HTTP disque (TTL 1h) pour le dev et
+    # les démos : les relances dans le TTL ne font aucun appel réseau.
+    # None = laisser yfinance gérer sa propre session (curl_cffi, déjà
+    # partagée entre threads via son singleton) ; injecter une session
+    # requests la remplacerait par un client que Yahoo throttle.
+    if requests_cache is None or not os.environ.get("PRISME_HTTP_CACHE"):
+        return None
+
+    session = requests_cache.CachedSession("prisme_http_cache", expire_after=3600)
+    try:
+        # Les versions récentes de yfinance refusent les sessions cachantes
+        # dès leur enregistrement ; un Ticker jetable le détecte sans appel
+        # réseau avant que l'ETL ne démarre.
+        yf.Ticker("SPY", session=session)
+    except Exception as e:
+        print(f"   [WARN] Cache HTTP ignoré, session refusée par yfinance : {e}")
+        return None
+    return session
+
+
+@lru_cache(maxsize=128)
+def _get_ticker(ticker_symbol: str):
+    if yfc is not None and USE_CACHE:
+        return yfc.Ticker(ticker_symbol)
+    session = _get_session()
+    if session is not None:
+        return yf.Ticker(ticker_symbol, session=session)
+    return yf.Ticker(ticker_symbol)
+
+
+@lru_cache(maxsize=128)
+def _get_info(ticker_symbol: str) -> dict:
+    return _get_ticker(ticker_symbol).info
+
+
+def _download_histories(symbols: list[str], period: str) -> dict[str, pd.DataFrame]:
+    # Un seul appel batché pour tous les historiques au lieu d'une requête
+    # HTTP par ticker (.info et .dividends n'ont pas d'endpoint batch).
+    # Session transmise uniquement si le cache HTTP opt-in est actif.
+    session_kwargs = {"session": _get_session()} if _get_session() is not None else {}
+    data = yf.download(
+        symbols,
+        period=period,
+        group_by="ticker",
+        threads=True,
+        progress=False,
+        **session_kwargs,
+    )
+    histories: dict[str, pd.DataFrame] = {}
+    if data is None or data.empty:
+        return histories
+    for symbol in symbols:
+        df = data[symbol] if isinstance(data.columns, pd.MultiIndex) else data
+        histories[symbol] = df.dropna(how="all")
+    return histories
+
+
+def extract_asset(
+    ticker_symbol: str,
+    period: str = "5y",
+    df_history: pd.DataFrame | None = None,
+) -> tuple[pd.DataFrame, dict, pd.Series]:
+    asset = _get_ticker(ticker_symbol)
+    if df_history is None:
+        df_history = asset.history(period=period)
+    asset_info = _get_info(ticker_symbol)
+    s_div = asset.dividends
+
+    # On retire le fuseau horaire une seule fois à la source : les étapes
+    # suivantes peuvent alors passer les données sans re-copie.
+    if not df_history.empty and df_history.index.tz is not None:
+        df_history.index = df_history.index.tz_localize(None)
+    if not s_div.empty and s_div.index.tz is not None:
+        s_div.index = s_div.index.tz_localize(None)
+
+    return df_history, asset_info, s_div
 
 
-def save_raw(name: str, df_history: pd.DataFrame, asset_info: dict) -> None:
+def save_raw(name: str, df_history: pd.DataFrame, asset_info: dict, write_csv: bool = False) -> None:
     if not df_history.empty:
         raw_price_path = RAW_DIR / f"{name}_raw_prices.csv"
-        df_history.to_csv(raw_price_path)
+        if write_csv:
+            df_history.to_csv(raw_price_path)
+        else:
+            # Rien en aval ne lit les CSV : le Parquet garde la traçabilité
+            # pour une fraction du temps de sérialisation et des octets.
+            raw_price_path = raw_price_path.with_suffix(".parquet")
+            df_history.to_parquet(raw_price_path, compression="zstd")
         print(f"   [RAW] Prix sauvegardés -> {raw_price_path}")
     else:
         print(f"   [WARN] Pas d'historique de prix pour {name}")
 
     raw_info_path = RAW_DIR / f"{name}_raw_infos.json"
-    raw_info_path.write_text(json.dumps(asset_info, indent=4), encoding="utf-8")
+    _write_json(raw_info_path, asset_info)
     print(f"   [RAW] Infos sauvegardées (JSON) -> {raw_info_path}")
 
 
-def build_interim_from_raw(
-    df_history: pd.DataFrame,
-    asset_info: dict,
-    df_div: pd.DataFrame,
-) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame | None]:
-    df_hist_interim = df_history.copy()
-    if not df_hist_interim.empty and df_hist_interim.index.tz is not None:
-        df_hist_interim.index = df_hist_interim.index.tz_localize(None)
-
-    df_info_interim = pd.DataFrame([asset_info])
-
-    df_div_interim = None
-    if df_div is not None and not df_div.empty:
-        df_div_interim = df_div.copy()
-        if df_div_interim.index.tz is not None:
-            df_div_interim.index = df_div_interim.index.tz_localize(None)
-
-    return df_hist_interim, df_info_interim, df_div_interim
-
-
 def save_interim(
     name: str,
     df_hist_interim: pd.DataFrame,
-    df_info_interim: pd.DataFrame,
-    df_div_interim: pd.DataFrame | None,
+    asset_info: dict,
+    s_div_interim: pd.Series | None,
+    write_csv: bool = False,
 ) -> None:
     if not df_hist_interim.empty:
         price_path = INTERIM_DIR / f"{name}_prices_interim.csv"
-        df_hist_interim.to_csv(price_path)
+        if write_csv:
+            df_hist_interim.to_csv(price_path)
+        else:
+            price_path = price_path.with_suffix(".parquet")
+            df_hist_interim.to_parquet(price_path, compression="zstd")
         print(f"   [INTERIM] Prix sauvegardés -> {price_path}")
 
     info_path = INTERIM_DIR / f"{name}_infos_interim.json"
-    info_record = df_info_interim.to_dict(orient="records")[0] if not df_info_interim.empty else {}
-    info_path.write_text(json.dumps(info_record, indent=4), encoding="utf-8")
+    _write_json(info_path, asset_info)
     print(f"   [INTERIM] Infos sauvegardées (JSON) -> {info_path}")
 
-    if df_div_interim is not None and not df_div_interim.empty:
+    if s_div_interim is not None and not s_div_interim.empty:
         div_path = INTERIM_DIR / f"{name}_dividends_interim.csv"
-        df_div_interim.to_csv(div_path)
+        if write_csv:
+            s_div_interim.to_csv(div_path)
+        else:
+            div_path = div_path.with_suffix(".parquet")
+            s_div_interim.to_frame().to_parquet(div_path, compression="zstd")
         print(f"   [INTERIM] Dividendes sauvegardés -> {div_path}")
 
 
-def transform_history_and_info(df_history: pd.DataFrame, asset_info: dict) -> tuple[pd.DataFrame, pd.DataFrame]:
-    if df_history.empty:
-        raise ValueError("DataFrame d'historique vide, impossible de transformer.")
-
-    df_history = df_history.copy()
-    if df_history.index.tz is not None:
-        df_history.index = df_history.index.tz_localize(None)
-    df_clean = df_history[["Open", "High", "Low", "Close", "Volume"]].copy()
-
-    clean_info_data = {k: asset_info.get(k, None) for k in KEYS_TO_KEEP}
-    df_info_clean = pd.DataFrame([clean_info_data])
-    return df_clean, df_info_clean
-
-
-def transform_dividends(df_div: pd.DataFrame) -> pd.DataFrame | None:
-    if df_div is None or df_div.empty:
+def transform_dividends(s_div: pd.Series | None) -> pd.DataFrame | None:
+    if s_div is None or s_div.empty:
         return None
-    df_div = df_div.copy()
-    if df_div.index.tz is not None:
-        df_div.index = df_div.index.tz_localize(None)
-    df_div.columns = ["Dividends"]
-    return df_div
+    return s_div.rename("Dividends").to_frame()
 
 
-def load_processed(name: str, df_clean: pd.DataFrame, df_info_clean: pd.DataFrame, df_div: pd.DataFrame | None) -> None:
+def load_processed(name: str, df_clean: pd.DataFrame, df_div: pd.DataFrame | None) -> None:
+    # ZSTD compresse ~15-20 % mieux que le Snappy par défaut, pour un surcoût
+    # de lecture négligeable côté Streamlit.
     price_path = PROCESSED_DIR / f"{name}_data.parquet"
-    df_clean.to_parquet(price_path)
-
-    info_path = PROCESSED_DIR / f"{name}_infos.parquet"
-    df_info_clean.to_parquet(info_path)
+    tbl = pa.Table.from_pandas(df_clean, schema=OHLCV_SCHEMA, preserve_index=True)
+    pq.write_table(tbl, price_path, compression="zstd", compression_level=3)
 
     if df_div is not None and not df_div.empty:
         div_path = PROCESSED_DIR / f"{name}_dividends.parquet"
-        df_div.to_parquet(div_path)
+        df_div.to_parquet(div_path, compression="zstd", compression_level=3)
 
-    print("   [PROCESSED] Données nettoyées sauvegardées (prix/infos/dividendes).")
+    print("   [PROCESSED] Données nettoyées sauvegardées (prix/dividendes).")
 
 
-def run_etl_for_universe(config_path: str | None = None, period: str = "5y") -> None:
-    print(f"--- DÉBUT DE L'ETL ({datetime.now().isoformat(timespec='seconds')}) ---")
-    setup_directories()
+def load_processed_infos(df_infos: pd.DataFrame) -> None:
+    # Un seul fichier multi-lignes pour tout l'univers : le footer/schéma
+    # Parquet est amorti et les lecteurs n'ouvrent qu'un fichier au lieu de N.
+    info_path = PROCESSED_DIR / "infos.parquet"
+    df_new = df_infos.reset_index().rename(columns={"_name": "name"})
 
-    tickers_map = load_universe(config_path)
-    for name, ticker_symbol in tickers_map.items():
-        print(f"\nTraitement de : {name} ({ticker_symbol})")
+    # Fusion avec le fichier existant : un ticker en échec sur ce run garde
+    # sa ligne du run précédent (son *_data.parquet reste servi lui aussi).
+    if info_path.exists():
         try:
-            df_history, asset_info, df_div_raw = extract_asset(ticker_symbol, period=period)
+            df_old = pd.read_parquet(info_path)
+            df_new = pd.concat(
+                [df_old[~df_old["name"].isin(df_new["name"])], df_new],
+                ignore_index=True,
+            ).sort_values("name", ignore_index=True)
+        except Exception as e:
+            print(f"   [WARN] infos.parquet existant illisible, réécriture complète : {e}")
 
-            save_raw(name, df_history, asset_info)
-            if df_history.empty:
-                continue
+    # Réalignement sur le schéma (colonnes absentes -> null) : un ancien
+    # fichier fusionné ne peut pas faire échouer la conversion Arrow.
+    df_new = df_new.reindex(columns=[field.name for field in INFO_SCHEMA])
+    tbl = pa.Table.from_pandas(df_new, schema=INFO_SCHEMA, preserve_index=False)
+    pq.write_table(tbl, info_path, compression="zstd", compression_level=1)
+    print(f"   [PROCESSED] Infos sauvegardées -> {info_path}")
 
-            df_hist_interim, df_info_interim, df_div_interim = build_interim_from_raw(
-                df_history=df_history,
-                asset_info=asset_info,
-                df_div=df_div_raw,
-            )
-            save_interim(name, df_hist_interim, df_info_interim, df_div_interim)
 
-            df_clean, df_info_clean = transform_history_and_info(df_hist_interim, asset_info)
-            df_div_processed = transform_dividends(df_div_interim if df_div_interim is not None else pd.DataFrame())
+def pipeline_one(
+    name: str,
+    df_history: pd.DataFrame,
+    asset_info: dict,
+    s_div: pd.Series | None,
+    write_csv: bool = False,
+) -> dict | None:
+    # Une seule frame tz-naïve traverse raw -> interim -> processed, sans
+    # copie intermédiaire : seules les écritures diffèrent par étape.
+    save_raw(name, df_history, asset_info, write_csv=write_csv)
+    if df_history.empty:
+        return None
 
-            load_processed(name, df_clean, df_info_clean, df_div_processed)
+    s_div = s_div if s_div is not None and not s_div.empty else None
+    save_interim(name, df_history, asset_info, s_div, write_csv=write_csv)
 
-        except Exception as e:
-            print(f"   [ERREUR] Échec du traitement pour {name} ({ticker_symbol}) : {e}")
+    df_clean = df_history.loc[:, ["Open", "High", "Low", "Close", "Volume"]]
+    load_processed(name, df_clean, transform_dividends(s_div))
+    return {"_name": name, **_filter_info(asset_info)}
+
+
+def _process_one(
+    name: str,
+    ticker_symbol: str,
+    period: str = "5y",
+    write_csv: bool = False,
+    df_history: pd.DataFrame | None = None,
+) -> dict | None:
+    print(f"\nTraitement de : {name} ({ticker_symbol})")
+    df_history, asset_info, s_div = extract_asset(ticker_symbol, period=period, df_history=df_history)
+    return pipeline_one(name, df_history, asset_info, s_div, write_csv=write_csv)
+
+
+def run_etl_for_universe(config_path: str | None = None, period: str = "5y", write_csv: bool = False) -> None:
+    print(f"--- DÉBUT DE L'ETL ({datetime.now().isoformat(timespec='seconds')}) ---")
+    setup_directories()
+
+    tickers_map = load_universe(config_path)
+
+    # Historique : un seul round-trip batché quand on tape l'API en direct.
+    # Avec yfinance-cache, on laisse chaque Ticker gérer son delta sur disque.
+    histories: dict[str, pd.DataFrame] = {}
+    if yfc is None or not USE_CACHE:
+        histories = _download_histories(list(tickers_map.values()), period)
+
+    # Le reste (info/dividends + sérialisation) est dominé par la latence
+    # réseau : on traite les tickers en parallèle avec une session partagée.
+    info_rows: list[dict] = []
+    with ThreadPoolExecutor(max_workers=min(16, len(tickers_map))) as executor:
+        futures = {
+            executor.submit(
+                _process_one, name, ticker_symbol, period, write_csv, histories.get(ticker_symbol)
+            ): (name, ticker_symbol)
+            for name, ticker_symbol in tickers_map.items()
+        }
+        for future in as_completed(futures):
+            name, ticker_symbol = futures[future]
+            try:
+                info_row = future.result()
+            except Exception as e:
+                print(f"   [ERREUR] Échec du traitement pour {name} ({ticker_symbol}) : {e}")
+            else:
+                if info_row is not None:
+                    info_rows.append(info_row)
+
+    # Une seule construction de DataFrame pour toutes les infos : l'inférence
+    # de dtypes ne tourne qu'une fois et les schémas restent homogènes.
+    if info_rows:
+        df_infos = pd.DataFrame(info_rows).set_index("_name")
+        load_processed_infos(df_infos)
 
     print(f"\n--- ETL TERMINÉ ({datetime.now().isoformat(timespec='seconds')}) ---")
 
@@ -196,12 +364,13 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Pipeline ETL produits financiers (yfinance -> RAW/INTERIM/PROCESSED).")
     parser.add_argument("--config", type=str, default=None, help="Chemin vers le JSON de config (ex: products_config.json).")
     parser.add_argument("--period", type=str, default="5y", help='Historique à récupérer (ex: "1y", "5y", "max").')
+    parser.add_argument("--write-csv", action="store_true", help="Écrire aussi les étapes RAW/INTERIM en CSV (Parquet par défaut).")
     return parser.parse_args(argv)
 
 
 def main(argv: list[str] | None = None) -> None:
     args = parse_args(argv)
-    run_etl_for_universe(config_path=args.config, period=args.period)
+    run_etl_for_universe(config_path=args.config, period=args.period, write_csv=args.write_csv)
 
 
 if __name__ == "__main__":
@@ -80,10 +80,18 @@ if not sel_tickers:
     st.stop()
 
 # ===================== Chargement des prix et infos =====================
+# Les infos de tout l'univers tiennent dans un seul fichier consolidé ;
+# les anciens fichiers par ETF servent de fallback.
+infos_path = PROCESSED_DIR / "infos.parquet"
+df_infos_all = pd.read_parquet(infos_path) if infos_path.exists() else None
+
 price_dfs, info_dfs = {}, {}
 for name in sel_tickers_dict:
     price_dfs[name] = pd.read_parquet(PROCESSED_DIR / f"{name}_data.parquet")
-    info_dfs[name] = pd.read_parquet(PROCESSED_DIR / f"{name}_infos.parquet")
+    if df_infos_all is not None:
+        info_dfs[name] = df_infos_all[df_infos_all["name"] == name].reset_index(drop=True)
+    else:
+        info_dfs[name] = pd.read_parquet(PROCESSED_DIR / f"{name}_infos.parquet")
 
 # ===================== Préparation graphique =====================
 plot_df = []
@@ -189,7 +197,7 @@ st.altair_chart(chart_risk, use_container_width=True)
 st.subheader("Répartition par Fund Family")
 repartition = []
 for name, df in info_dfs.items():
-    family = df["fundFamily"].iloc[0] if "fundFamily" in df.columns else "Inconnu"
+    family = df["fundFamily"].iloc[0] if "fundFamily" in df.columns and not df.empty else "Inconnu"
     repartition.append({"ETF": name, "FundFamily": family})
 
 repart_df = pd.DataFrame(repartition)